@@ -40,7 +40,7 @@ def processEvent(self, datasetId, event):
         del event['Region']
         primitive, newR = self.processPrimitive(datasetId, primitiveName, 'otf2')
         seenR = 1 if newR == 0 else 0
-        if self.debugSources is True:
+        if self.debugSources:
             if 'eventCount' not in primitive:
                 primitive['eventCount'] = 0
             primitive['eventCount'] += 1
@@ -382,15 +382,20 @@ async def buildSparseUtilizationLists(self, datasetId, log=logToConsole):
     allLocations = set()
 
     def updateSULForInterval(event, cur_location):
-        if 'metrics' in event:
-            for k, value in event['metrics'].items():
-                if k not in allSuls['metrics']:
+        metrics = event.get('metrics')
+        if metrics:
+            timestamp = event['Timestamp']
+            for k, value in metrics.items():
+                # state is a [last timestamp, last value] pair; one dict lookup
+                # per metric per event instead of five
+                state = preMetricValue.get(k)
+                if state is None:
                     allSuls['metrics'][k] = SparseUtilizationList(False)
-                    preMetricValue[k] = {'Timestamp': 0, 'Value': 0}
-                current_rate = (value - preMetricValue[k]['Value']) / (event['Timestamp'] - preMetricValue[k]['Timestamp'])
-                allSuls['metrics'][k].setIntervalAtLocation({'index': int(event['Timestamp']), 'counter': 0, 'util': current_rate}, cur_location)
-                preMetricValue[k]['Timestamp'] = event['Timestamp']
-                preMetricValue[k]['Value'] = value
+                    state = preMetricValue[k] = [0, 0.0]
+                current_rate = (value - state[1]) / (timestamp - state[0])
+                allSuls['metrics'][k].setIntervalAtLocation(int(timestamp), 0, current_rate, cur_location)
+                state[0] = timestamp
+                state[1] = value
 
     def updateIntervalDuration(event):
         duration = event['leave']['Timestamp'] - event['enter']['Timestamp']
@@ -407,17 +412,17 @@ async def buildSparseUtilizationLists(self, datasetId, log=logToConsole):
         loc = intervalObj['Location']
         allLocations.add(loc)
         primitive_name = intervalObj['Primitive']
+        enterTimestamp = int(intervalObj['enter']['Timestamp'])
+        leaveTimestamp = int(intervalObj['leave']['Timestamp'])
 
         # Update the full SparseUtilizationList
-        allSuls['intervals'].setIntervalAtLocation({'index': int(intervalObj['enter']['Timestamp']), 'counter': 1, 'util': 0, 'primitive': primitive_name}, loc)
-        allSuls['intervals'].setIntervalAtLocation({'index': int(intervalObj['leave']['Timestamp']), 'counter': -1, 'util': 0, 'primitive': primitive_name}, loc)
+        allSuls['intervals'].setIntervalPairAtLocation(enterTimestamp, leaveTimestamp, loc, primitive_name)
 
         # Create a SparseUtilizationList for the primitive if we haven't yet
         if primitive_name not in allSuls['primitives']:
             allSuls['primitives'][primitive_name] = SparseUtilizationList()
         # ... and update it
-        allSuls['primitives'][primitive_name].setIntervalAtLocation({'index': int(intervalObj['enter']['Timestamp']), 'counter': 1, 'util': 0, 'primitive': primitive_name}, loc)
-        allSuls['primitives'][primitive_name].setIntervalAtLocation({'index': int(intervalObj['leave']['Timestamp']), 'counter': -1, 'util': 0, 'primitive': primitive_name}, loc)
+        allSuls['primitives'][primitive_name].setIntervalPairAtLocation(enterTimestamp, leaveTimestamp, loc, primitive_name)
 
         # Create / update SparseUtilizationLists for any metrics
         updateSULForInterval(intervalObj['enter'], loc)
@@ -461,14 +466,10 @@ async def buildSparseUtilizationLists(self, datasetId, log=logToConsole):
     for primitive in intervalHistograms:
         allSuls['intervalHistograms'][primitive] = SparseUtilizationList(False)
         for ind, value in intervalHistograms[primitive].items():
-            allSuls['intervalHistograms'][primitive].setIntervalAtLocation({'index': int(ind), 'counter': 0, 'util': value}, dummyLocation)
-
-        allSuls['intervalHistograms'][primitive].sortAtLoc(dummyLocation)
-        length = len(allSuls['intervalHistograms'][primitive].locationDict[dummyLocation])
-        intervalDurationDomainDict[primitive] = [
-            allSuls['intervalHistograms'][primitive].locationDict[dummyLocation][0]['index'],
-            allSuls['intervalHistograms'][primitive].locationDict[dummyLocation][length-1]['index']
-        ]
+            allSuls['intervalHistograms'][primitive].setIntervalAtLocation(int(ind), 0, value, dummyLocation)
+
+        durations = allSuls['intervalHistograms'][primitive].locationDict[dummyLocation]['index']
+        intervalDurationDomainDict[primitive] = [min(durations), max(durations)]
         count += 1
         if count % 2500 == 0:
             await log('.', end='')
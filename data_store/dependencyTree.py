@@ -1,4 +1,3 @@
-import copy
 import uuid
 
 from .sparseUtilizationList import SparseUtilizationList
@@ -110,16 +109,13 @@ class DependencyTreeNode:
                 if eachAgg.endTime > aggMaxTime:
                     aggMaxTime = eachAgg.endTime
                 for location, utilObj in eachAgg.utilization.locationDict.items():
-                    if location not in ab.utilization.locationDict:
-                        ab.utilization.locationDict[location] = list()
-                    ab.utilization.locationDict[location].extend(copy.deepcopy(utilObj))
+                    ab.utilization.extendIntervalsAtLocation(utilObj, location)
                     allLocations.add(location)
             maxTime = max(maxTime, aggMaxTime)
 
         ab.updateEndTime(maxTime)
         ab.firstPrimitiveName = primitive_name
-        ab.utilization.setIntervalAtLocation({'index': int(startTime), 'counter': 1, 'util': 0, 'primitive': primitive_name}, loc)
-        ab.utilization.setIntervalAtLocation({'index': int(endTime), 'counter': -1, 'util': 0, 'primitive': primitive_name}, loc)
+        ab.utilization.setIntervalPairAtLocation(int(startTime), int(endTime), loc, primitive_name)
         ab.allLocations = list(allLocations)
         self.aggregatedBlockList.append(ab)
 
@@ -140,18 +136,18 @@ class DependencyTreeNode:
 
         allDummyLocations = list()
         for ind, eachBlock in enumerate(self.aggregatedBlockList):
-            if eachBlock.isFinalized is False:  # since the root node takes all children nodes, we need this check
+            if not eachBlock.isFinalized:  # since the root node takes all children nodes, we need this check
                 eachBlock.utilization.finalize(eachBlock.allLocations)
                 eachBlock.isFinalized = True
 
             if minAmongLocation['time'] < eachBlock.startTime:
-                self.aggregatedUtil.setIntervalAtLocation({'index': int(eachBlock.startTime), 'counter': 0, 'util': ind+1}, minAmongLocation['location'])
-                self.aggregatedUtil.setIntervalAtLocation({'index': int(eachBlock.endTime), 'counter': 0, 'util': ind+1}, minAmongLocation['location'])
+                self.aggregatedUtil.setIntervalAtLocation(int(eachBlock.startTime), 0, ind+1, minAmongLocation['location'])
+                self.aggregatedUtil.setIntervalAtLocation(int(eachBlock.endTime), 0, ind+1, minAmongLocation['location'])
                 locationEndTime[minAmongLocation['location']] = eachBlock.endTime
                 minAmongLocation = updateMinAmongLocation()
             else:
-                self.aggregatedUtil.setIntervalAtLocation({'index': int(eachBlock.startTime), 'counter': 0, 'util': ind+1}, dummyLocation)
-                self.aggregatedUtil.setIntervalAtLocation({'index': int(eachBlock.endTime), 'counter': 0, 'util': ind+1}, dummyLocation)
+                self.aggregatedUtil.setIntervalAtLocation(int(eachBlock.startTime), 0, ind+1, dummyLocation)
+                self.aggregatedUtil.setIntervalAtLocation(int(eachBlock.endTime), 0, ind+1, dummyLocation)
                 locationEndTime[dummyLocation] = eachBlock.endTime
                 minAmongLocation = updateMinAmongLocation()
                 allDummyLocations.append(dummyLocation)
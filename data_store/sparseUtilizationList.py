@@ -1,101 +1,254 @@
 # Imports
-import copy
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import json
 from profiling_tools._cCalcBin import ffi, lib
 
+# numba is optional (it isn't in requirements.txt); when it's importable we
+# JIT the histogram merge pass and skip the cffi crossing and its per-call
+# marshalling, which dominates small requests
+try:
+    import numba
+except ImportError:
+    numba = None
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _jitHistogram(criticalPts, index, counter, util, outUtil):
+        # Same merge pass as calcHistogramMulti's inner loop in calcBin.c
+        n = len(index)
+        nextRecordIndex = 0
+        for i in range(len(criticalPts)):
+            pt = criticalPts[i]
+            if n == 0 or pt < index[0]:
+                outUtil[i] = 0.0
+            else:
+                while nextRecordIndex < n - 1 and index[nextRecordIndex + 1] <= pt:
+                    nextRecordIndex += 1
+                outUtil[i] = (pt - index[nextRecordIndex]) * counter[nextRecordIndex] + util[nextRecordIndex]
+
+    @numba.njit(cache=True, parallel=True)
+    def _jitHistogramMulti(criticalPts, index, counter, util, offsets, outUtil):
+        # Same layout as calcHistogramMulti in calcBin.c: location l occupies
+        # [offsets[l], offsets[l+1]) of the flat arrays and writes row l
+        for l in numba.prange(len(offsets) - 1):
+            lo = offsets[l]
+            hi = offsets[l + 1]
+            _jitHistogram(criticalPts, index[lo:hi], counter[lo:hi], util[lo:hi], outUtil[l])
+
 class SparseUtilizationList():
     def __init__(self, isUpdate=True):
         self.locationDict = dict()
         self.cLocationDict = dict()
         self.isUpdateCounter = isUpdate
+        # Flat concatenations of the per-location arrays (built by finalize) so
+        # the multi-location kernel can process every location in one C call
+        self.flatLocationOrder = None
+        self.flatLocations = None
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Pickles written before the flat arrays existed fall back to the
+        # per-location code paths
+        self.__dict__.setdefault('flatLocationOrder', None)
+        self.__dict__.setdefault('flatLocations', None)
+        # Pickles from before the column layout stored each location as an
+        # array of {'index', 'counter', 'util', 'primitive'} dicts (already
+        # sorted and finalized in place); repack them into parallel columns so
+        # the query paths can keep indexing locationDict by field
+        for location, entries in self.locationDict.items():
+            if isinstance(entries, dict):
+                continue
+            columns = self._emptyColumns()
+            for entry in entries:
+                columns['index'].append(entry['index'])
+                columns['counter'].append(entry['counter'])
+                columns['util'].append(entry['util'])
+                columns['primitive'].append(entry.get('primitive'))
+            self.locationDict[location] = columns
 
     def getCLocation(self, loc):
         return self.cLocationDict[loc]
 
     def setCLocation(self, loc, val):
-        self.cLocationDict[loc] = copy.deepcopy(val)
-
-    def sortAtLoc(self, loc):
-        self.locationDict[loc].sort(key=lambda x: x['index'])
+        # The caller (finalize) builds a fresh dict of arrays per location and
+        # never touches it again, so ownership just transfers; deep-copying
+        # every array here doubled the build cost for nothing
+        for arr in val.values():
+            # the kernels read these buffers in place, which is only safe for
+            # C-contiguous arrays
+            assert arr.flags['C_CONTIGUOUS']
+        self.cLocationDict[loc] = val
 
     def finalize(self, allLocations, isCumulative=False):
         for loc in allLocations:
-            if loc in self.locationDict:
-                self.sortAtLoc(loc)
-            self.locationDict[loc] = np.array(self.locationDict.get(loc, []))
-
-            length = len(self.locationDict[loc])
-            if self.isUpdateCounter:
-                counter = 0
-                for i, criticalPt in enumerate(self.locationDict[loc]):
-                    counter += criticalPt['counter']
-                    criticalPt['counter'] = counter
-                    if i == 0:
-                        criticalPt['util'] = self.calcCurrentUtil(criticalPt['index'], None)
-                    else:
-                        criticalPt['util'] = self.calcCurrentUtil(criticalPt['index'], self.locationDict[loc][i-1])
-
-            locStruct = {'index': np.empty(length, dtype=np.int64), 'counter': np.empty(length, dtype=np.int64), 'util': np.zeros(length, dtype=np.double)}
-            for i in range(length):
-                locStruct['index'][i] = self.locationDict[loc][i]['index']
-                locStruct['counter'][i] = self.locationDict[loc][i]['counter']
-                locStruct['util'][i] = self.locationDict[loc][i]['util']
-                if isCumulative is True and i > 0:
-                    locStruct['util'][i] = locStruct['util'][i] + locStruct['util'][i-1]
-            self.setCLocation(loc, locStruct)
-
-    def calcCurrentUtil(self, index, prior):
-        if prior is None:
-            last = {'index': 0, 'counter': 0, 'util': 0}
-        else:
-            last = prior
+            columns = self.locationDict.get(loc)
+            if columns is None:
+                columns = self.locationDict[loc] = self._emptyColumns()
+
+            # The ingest lists are already parallel columns, so converting to
+            # numpy is a straight bulk copy per field
+            index = np.asarray(columns['index'], dtype=np.int64)
+            counter = np.asarray(columns['counter'], dtype=np.int64)
+            util = np.asarray(columns['util'], dtype=np.double)
+            # Sort every column by index with a single C-level argsort instead
+            # of sorting Python dicts; the sort must be stable so that critical
+            # points sharing a timestamp keep their ingest order (the merge
+            # kernels read the last entry at or before each critical point)
+            order = np.argsort(index, kind='stable')
+            index = index[order]
+            counter = counter[order]
+            util = util[order]
+            columns['index'] = index
+            columns['counter'] = counter
+            columns['util'] = util
+            columns['primitive'] = np.asarray(columns['primitive'], dtype=object)[order]
+
+            if self.isUpdateCounter and len(index) > 0:
+                # Turn the +1 / -1 deltas into a running count of open intervals,
+                # then integrate the counter step function to get utilization:
+                # util[i] = util[i-1] + (index[i] - index[i-1]) * counter[i-1]
+                counter = np.cumsum(counter)
+                dt = np.empty_like(index)
+                dt[0] = index[0]
+                dt[1:] = np.diff(index)
+                priorCounter = np.concatenate(([0], counter[:-1]))
+                util = np.cumsum(dt * priorCounter).astype(np.double)
+            if isCumulative:
+                util = np.cumsum(util)
+            self.setCLocation(loc, {'index': index, 'counter': counter, 'util': util})
+
+        # Concatenate all the per-location arrays so calcHistogramMulti can
+        # process every location in a single C call; location i occupies
+        # [offsets[i], offsets[i+1]) of the flat arrays
+        self.flatLocationOrder = list(self.locationDict.keys())
+        offsets = np.zeros(len(self.flatLocationOrder) + 1, dtype=np.int64)
+        for i, loc in enumerate(self.flatLocationOrder):
+            offsets[i+1] = offsets[i] + len(self.cLocationDict[loc]['index'])
+        self.flatLocations = {
+            'index': np.concatenate([self.cLocationDict[loc]['index'] for loc in self.flatLocationOrder] or [np.empty(0, dtype=np.int64)]),
+            'counter': np.concatenate([self.cLocationDict[loc]['counter'] for loc in self.flatLocationOrder] or [np.empty(0, dtype=np.int64)]),
+            'util': np.concatenate([self.cLocationDict[loc]['util'] for loc in self.flatLocationOrder] or [np.empty(0, dtype=np.double)]),
+            'offsets': offsets
+        }
+
+    @staticmethod
+    def _emptyColumns():
+        return {'index': [], 'counter': [], 'util': [], 'primitive': []}
+
+    def setIntervalAtLocation(self, index, counter, util, location, primitive=None):
+        # check if the location's columns exist
+        columns = self.locationDict.get(location)
+        if columns is None:
+            columns = self.locationDict[location] = self._emptyColumns()
+
+        columns['index'].append(index)
+        columns['counter'].append(counter)
+        columns['util'].append(util)
+        columns['primitive'].append(primitive)
+        return
 
-        return (((index - last['index']) * last['counter'])+last['util'])
+    # Appends both critical points of an interval (+1 at enter, -1 at leave)
+    # with a single location lookup; this is the hot path of
+    # buildSparseUtilizationLists, which calls it once per interval instead of
+    # paying two setIntervalAtLocation calls
+    def setIntervalPairAtLocation(self, enter, leave, location, primitive=None):
+        columns = self.locationDict.get(location)
+        if columns is None:
+            columns = self.locationDict[location] = self._emptyColumns()
 
-    def setIntervalAtLocation(self, edgeUtilObj, location):
-        # check if array exists
-        if location not in self.locationDict:
-            self.locationDict[location] = []
+        columns['index'].extend((enter, leave))
+        columns['counter'].extend((1, -1))
+        columns['util'].extend((0, 0))
+        columns['primitive'].extend((primitive, primitive))
+        return
+
+    # Bulk-appends another list's raw columns for one location (used when a
+    # parent aggregated block absorbs its children's critical points in the
+    # dependency tree); works whether the source columns are still ingest
+    # lists or already sorted numpy arrays
+    def extendIntervalsAtLocation(self, otherColumns, location):
+        columns = self.locationDict.get(location)
+        if columns is None:
+            columns = self.locationDict[location] = self._emptyColumns()
 
-        self.locationDict[location].append(edgeUtilObj)
+        for field in ('index', 'counter', 'util', 'primitive'):
+            columns[field].extend(otherColumns[field])
         return
 
     # Calculates utilization histogram for all intervals regardless of location
     def calcGanttHistogram(self, bins=100, begin=None, end=None):
-        listOfLocations = []
-
-        for location in self.locationDict:
-            temp = self.calcUtilizationForLocation(bins, begin, end, location)
-            listOfLocations.append({"location":location, "histogram":temp})
+        allHistograms = self._histogramForAllLocations(bins, begin, end)
+        if allHistograms is not None:
+            return [{"location": location, "histogram": histogram.tolist()}
+                    for location, histogram in zip(self.flatLocationOrder, allHistograms)]
 
-        return listOfLocations
+        # Locations are independent and the heavy lifting is numpy / JIT'd
+        # code that drops the GIL, so fan the per-location calls out over a
+        # thread pool
+        criticalPts = self._criticalPoints(bins, begin, end)
+        locations = list(self.locationDict)
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            histograms = list(pool.map(
+                lambda location: self._histogramForLocation(bins, begin, end, location, criticalPts=criticalPts),
+                locations))
+        return [{"location": location, "histogram": histogram.tolist()}
+                for location, histogram in zip(locations, histograms)]
 
     # Calculates utilization histogram for all intervals regardless of location
     def calcUtilizationHistogram(self, bins=100, begin=None, end=None, isInterval=True):
-        array = []
-        isFirst = True
+        allHistograms = self._histogramForAllLocations(bins, begin, end, isInterval)
+        if allHistograms is not None:
+            return allHistograms.sum(axis=0).tolist()
+
+        criticalPts = self._criticalPoints(bins, begin, end)
+        array = np.zeros(bins, dtype=np.float64)
         for location in self.locationDict:
-            temp = self.calcUtilizationForLocation(bins, begin, end, location, isInterval)
-            if isFirst is True:
-                isFirst = False
-                array = temp
-            else:
-                for i in range(bins):
-                    array[i] = array[i] + temp[i]
+            array += self._histogramForLocation(bins, begin, end, location, isInterval, criticalPts)
+        return array.tolist()
 
-        return array
+    # Runs the histogram kernel over every location in a single C call
+    # (parallelized across locations inside the kernel), returning a
+    # (numLocations, bins) array of per-bin values in flatLocationOrder.
+    # Returns None for instances pickled before the flat arrays existed.
+    def _histogramForAllLocations(self, bins, begin, end, isInterval=True):
+        flat = getattr(self, 'flatLocations', None)
+        if flat is None:
+            return None
+
+        criticalPts = self._criticalPoints(bins, begin, end)
+        numLocations = len(self.flatLocationOrder)
+        utils = np.zeros((numLocations, bins + 1), dtype=np.float64)
+        if numba is not None:
+            _jitHistogramMulti(criticalPts, flat['index'], flat['counter'], flat['util'], flat['offsets'], utils)
+        else:
+            lib.calcHistogramMulti(ffi.from_buffer("double[]", utils),
+                                   numLocations,
+                                   ffi.from_buffer("long long[]", criticalPts), bins + 1,
+                                   ffi.from_buffer("long long[]", flat['index']),
+                                   ffi.from_buffer("long long[]", flat['counter']),
+                                   ffi.from_buffer("double[]", flat['util']),
+                                   ffi.from_buffer("long long[]", flat['offsets']))
+        if isInterval:
+            integrals = (utils[:, 1:] - utils[:, :-1]) / np.diff(criticalPts)
+        else:
+            integrals = utils[:, 1:]
+        # float32 is plenty for the on-screen charts these feed (the prefix
+        # sums and the kernels stay float64)
+        return integrals.astype(np.float32)
 
     # Calculates metric histogram
     def calcMetricHistogram(self, bins=100, begin=None, end=None, location=None):
-        array = []
         if location is not None:
             return self.calcUtilizationForLocation(bins, begin, end, location, False)
-        for location in self.locationDict:
-            temp = self.calcUtilizationForLocation(bins, begin, end, location, False)
-            array.append(temp)
-        array = np.asarray(array)
+        criticalPts = self._criticalPoints(bins, begin, end)
+        # preallocate the (numLocations, bins) output and slice-assign each
+        # row instead of growing a Python list and re-copying it at the end
+        array = np.empty((len(self.locationDict), bins), dtype=np.float32)
+        for i, location in enumerate(self.locationDict):
+            array[i] = self._histogramForLocation(bins, begin, end, location, False, criticalPts)
         avgArray = np.mean(array, axis=0)
         minArray = np.amin(array, axis=0)
         maxArray = np.amax(array, axis=0)
@@ -109,48 +262,64 @@ class SparseUtilizationList():
     # Calculates utilization for one location in a Gantt chart
     # Location designates a particular CPU or Thread and denotes the y-axis on the Gantt Chart
     def calcUtilizationForLocation(self, bins=100, begin=None, end=None, Location=None, isInterval=True):
+        return self._histogramForLocation(bins, begin, end, Location, isInterval).tolist()
+
+    # caclulates the beginning of each each bin evenly divided over the range of
+    # time indicies and stores them as critical points; the same array is shared
+    # by every location of the same request
+    @staticmethod
+    def _criticalPoints(bins, begin, end):
         rangePerBin = (end-begin)/bins
+        criticalPts = (begin + np.arange(bins + 1) * rangePerBin).astype(np.int64)
+        criticalPts[bins] = end
+        return criticalPts
 
-        # caclulates the beginning of each each bin evenly divided over the range of
-        # time indicies and stores them as critical points
-        criticalPts = np.empty(bins + 1, dtype=np.int64)
-        critical_length = len(criticalPts)
-        critical_points = ffi.new("long long[]", critical_length)
-        for i in range(0, bins):
-            criticalPts[i] = (i * rangePerBin) + begin
-            critical_points[i] = int((i * rangePerBin) + begin)
-        criticalPts[len(criticalPts)-1] = end
-        critical_points[len(criticalPts)-1] = end
-
-        # searches
-        histogram = np.empty_like(criticalPts, dtype=object)
-        location = self.locationDict[Location]
-        length = len(location)
-        histogram_length = len(histogram)
-
-        histogram_index = ffi.new("long long[]", histogram_length)
-        histogram_counter = ffi.new("long long[]", histogram_length)
-        histogram_util = ffi.new("double[]", histogram_length)
+    # Numpy-array flavor of calcUtilizationForLocation, so that callers
+    # aggregating across locations can accumulate without round-tripping
+    # through Python lists; callers iterating several locations should compute
+    # criticalPts once with _criticalPoints and pass it in
+    def _histogramForLocation(self, bins, begin, end, Location, isInterval=True, criticalPts=None):
+        if criticalPts is None:
+            criticalPts = self._criticalPoints(bins, begin, end)
 
         cLocationStruct = self.getCLocation(Location)
-        location_index = ffi.cast("long long*", cLocationStruct['index'].ctypes.data)
-        location_counter = ffi.cast("long long*", cLocationStruct['counter'].ctypes.data)
-        location_util = ffi.cast("double*", cLocationStruct['util'].ctypes.data)
-
-        lib.calcHistogram(histogram_counter, histogram_length, histogram_index, histogram_util, critical_points, critical_length, location_index, length-1, location_counter, location_util)
-        histogram[0] = {'integral': 0, 'index': histogram_index[0], 'util': histogram_util[0], 'counter': histogram_counter[0]}
-        prev = histogram[0]
-        prettyHistogram = []
-        for i in range(1, len(histogram)):
-            histogram[i] = {'index': histogram_index[i], 'util': histogram_util[i], 'counter': histogram_counter[i]}
-            current = histogram[i]
-            val = current['util']
-            if isInterval:
-                val = (current['util'] - prev['util']) / (current['index'] - prev['index'])
-            current['integral'] = val
-            prev = current
-            prettyHistogram.append(histogram[i]['integral'])
-        return prettyHistogram
+        index = cLocationStruct['index']
+        counter = cLocationStruct['counter']
+        util = cLocationStruct['util']
+
+        if len(index) > 0:
+            # Clip to the queried range up front: in a zoomed-in view only the
+            # slice overlapping [begin, end] matters, plus the critical point
+            # just before it, which carries the running counter/util state
+            lo = max(int(np.searchsorted(index, criticalPts[0], side='right')) - 1, 0)
+            hi = min(int(np.searchsorted(index, criticalPts[-1], side='left')) + 1, len(index))
+            index = index[lo:hi]
+            counter = counter[lo:hi]
+            util = util[lo:hi]
+
+        if numba is not None:
+            # JIT'd merge pass; everything stays in the nopython domain
+            utils = np.empty(len(criticalPts), dtype=np.float64)
+            _jitHistogram(criticalPts, index, counter, util, utils)
+        elif len(index) == 0:
+            utils = np.zeros(len(criticalPts), dtype=np.float64)
+        else:
+            # Utilization at any time t is util[k] + counter[k] * (t - index[k])
+            # for the last critical point k at or before t, so a single
+            # vectorized searchsorted over the prefix-sum arrays answers every
+            # bin boundary at once — no per-location C call needed
+            k = np.searchsorted(index, criticalPts, side='right') - 1
+            before = k < 0
+            k[before] = 0
+            utils = util[k] + counter[k] * (criticalPts - index[k])
+            utils[before] = 0.0
+
+        # The per-bin results only feed on-screen charts, so float32 precision
+        # is plenty; the prefix sums stay float64 because the cumulative utils
+        # reach timestamp magnitudes
+        if isInterval:
+            return (np.diff(utils) / np.diff(criticalPts)).astype(np.float32)
+        return utils[1:].astype(np.float32)
 
     # Calculates utilization for each primitive and returns util per duration
     def calcUtilizationForPrimitive(self, bins=100,
@@ -170,32 +339,36 @@ class SparseUtilizationList():
             criticalPts = (i * rangePerBin) + begin
 
             for location in self.locationDict:
+                cLocationStruct = self.getCLocation(location)
+                cIndex = cLocationStruct['index']
+                cCounter = cLocationStruct['counter']
+                primitives = self.locationDict[location]['primitive']
                 if location not in location_struct_index:
                     location_struct_index[location] = 0
                 if location not in location_struct_length:
-                    location_struct_length[location] = len(self.locationDict[location])
+                    location_struct_length[location] = len(cIndex)
 
                 while location_struct_index[location] < location_struct_length[location]:
-                    locStruct = self.locationDict[location][location_struct_index[location]]
+                    currentIndex = location_struct_index[location]
                     # since its sorted per location, all end indexes are from the same interval of previous enter index
-                    if location_struct_index[location] > 0:
-                        startIndex = self.locationDict[location][location_struct_index[location]-1]['index']
+                    if currentIndex > 0:
+                        startIndex = cIndex[currentIndex-1]
                     else:
                         startIndex = 0
-                    if (locStruct['primitive'] == primitive or primitive == 'all_primitives') and locStruct['counter'] == 0:
+                    if (primitives[currentIndex] == primitive or primitive == 'all_primitives') and cCounter[currentIndex] == 0:
                         if startIndex < criticalPts:
                             intervalChunkStart = max(preCriticalPts, startIndex)
-                            intervalChunkEnd = min(criticalPts, locStruct['index'])
+                            intervalChunkEnd = min(criticalPts, cIndex[currentIndex])
                             currentUtil = intervalChunkEnd - intervalChunkStart  # it should cover left/right/full overlap cases
-                            duration = locStruct['index'] - startIndex
+                            duration = cIndex[currentIndex] - startIndex
                             durationIndex = int((duration - durationBegin) // rangePerDurationBin)
                             primitiveCountPerBin[i, durationIndex] = primitiveCountPerBin[i, durationIndex] + float(currentUtil)
                             if primitiveCountPerBin[i, durationIndex] < 0:
                                 print("Error: negative Util found " + str(primitiveCountPerBin[i, durationIndex]))
                                 return []
-                        if locStruct['index'] > criticalPts:  # check this explicitly, you dont wanna increase the index number
+                        if cIndex[currentIndex] > criticalPts:  # check this explicitly, you dont wanna increase the index number
                             break
-                    location_struct_index[location] = location_struct_index[location] + 1
+                    location_struct_index[location] = currentIndex + 1
 
             preCriticalPts = criticalPts
         return primitiveCountPerBin.tolist()
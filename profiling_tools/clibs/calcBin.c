@@ -56,3 +56,41 @@ int main() {
 	return 0;
 }
 */
+
+/* Runs the merge-pass histogram over every location in one call. Locations
+ * live back-to-back in the flat location_* arrays; location l occupies
+ * [offsets[l], offsets[l+1]). Each location writes its util samples into its
+ * own row of histogram_utils (num_locations x critical_points_size), so the
+ * outer loop is trivially parallel. */
+void calcHistogramMulti(double *histogram_utils,
+		int num_locations,
+		long long *critical_points, int critical_points_size,
+		long long *location_index,
+		long long *location_counter,
+		double *location_util,
+		long long *offsets) {
+	int l;
+	#pragma omp parallel for schedule(dynamic)
+	for(l=0;l<num_locations;l++){
+		long long lo = offsets[l];
+		long long n = offsets[l+1] - lo;
+		long long *index = location_index + lo;
+		long long *counter = location_counter + lo;
+		double *util = location_util + lo;
+		double *out = histogram_utils + (long long)l * critical_points_size;
+		long long nextRecordIndex = 0;
+		int i;
+
+		for(i=0;i<critical_points_size;i++){
+			long long pt = critical_points[i];
+			if(n == 0 || pt < index[0]) {
+				out[i] = 0;
+			} else {
+				while(nextRecordIndex < n-1 && index[nextRecordIndex+1] <= pt) {
+					nextRecordIndex++;
+				}
+				out[i] = (((pt - index[nextRecordIndex]) * counter[nextRecordIndex]) + util[nextRecordIndex]);
+			}
+		}
+	}
+}
@@ -6,3 +6,10 @@ void calcHistogram(long long *histogram_counter, int histogram_size,
 		long long *location_index, int location_size,
 		long long *location_counter,
 		double *location_util);
+void calcHistogramMulti(double *histogram_utils,
+		int num_locations,
+		long long *critical_points, int critical_points_size,
+		long long *location_index,
+		long long *location_counter,
+		double *location_util,
+		long long *offsets);
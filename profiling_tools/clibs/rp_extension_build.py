@@ -10,6 +10,13 @@ ffibuilder.cdef("""
 		long long *location_index, int location_size,
 		long long *location_counter,
 		double *location_util);
+    void calcHistogramMulti(double *histogram_utils,
+		int num_locations,
+		long long *critical_points, int critical_points_size,
+		long long *location_index,
+		long long *location_counter,
+		double *location_util,
+		long long *offsets);
 
        """)
 
@@ -18,7 +25,9 @@ ffibuilder.set_source("_cCalcBin",  # name of the output C extension
     #include "calcBin.h"
     """,
     sources=['calcBin.c'],
-    libraries=['m'])
+    libraries=['m'],
+    extra_compile_args=['-fopenmp'],  # calcHistogramMulti parallelizes across locations
+    extra_link_args=['-fopenmp'])
 
 if __name__ == "__main__":
         ffibuilder.compile(verbose=True)
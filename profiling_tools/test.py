@@ -23,7 +23,7 @@ def test():
 
     n = 10
     for i in range(n):
-        if i % 1 is 0:
+        if i % 1 == 0:
             print(".")
         prf.start()
         mm(A, B)